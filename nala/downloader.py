@@ -28,21 +28,33 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
+import ctypes
 import hashlib
+import os
+import platform
 import re
 import shutil
 import sys
-from asyncio import AbstractEventLoop, CancelledError, gather, run, sleep
+import threading
+from asyncio import (
+	FIRST_EXCEPTION,
+	AbstractEventLoop,
+	CancelledError,
+	gather,
+	run,
+	sleep,
+	wait,
+)
 from collections import Counter
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from errno import ENOENT
 from functools import partial
 from pathlib import Path
 from signal import Signals  # pylint: disable=no-name-in-module #Codacy
 from signal import SIGINT, SIGTERM
-from typing import Generator, Iterable, List, Sequence, Union, cast
+from typing import Callable, Generator, Iterable, List, Sequence, Union, cast
 
-from anyio import open_file
+from anyio import open_file, to_thread
 from apt.package import Package, Version
 from apt_pkg import Configuration, config
 from httpx import (
@@ -84,6 +96,14 @@ MIRROR_PATTERN = re.compile(r"mirror://(.*?/.*?)/")
 MIRROR_FILE_PATTERN = re.compile(r"mirror\+file:(/.*?)/pool")
 URL_PATTERN = re.compile(r"(https?://.*?/.*?)/")
 
+# The fallocate syscall itself. posix_fallocate would fall back
+# to writing out every block where the filesystem can't do it.
+try:
+	FALLOCATE = ctypes.CDLL(None, use_errno=True).fallocate64
+	FALLOCATE.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+except (OSError, AttributeError):
+	FALLOCATE = None
+
 STARTING_DOWNLOADS = color(_("Starting Downloads") + ELLIPSIS, "BLUE")
 
 STARTING_DOWNLOAD = color(_("Starting Download:"), "BLUE")
@@ -152,6 +172,11 @@ class URL:  # pylint: disable=too-many-instance-attributes
 	hash: str = ""
 	failed: bool = False
 	no_hash: bool = False
+	partial: Path = field(init=False, repr=False)
+
+	def __post_init__(self) -> None:
+		"""Set the path the file is downloaded to before it's moved."""
+		self.partial = PARTIAL_DIR / self.path.name
 
 	def filename(self) -> str:
 		"""Return the final portion of the filename."""
@@ -205,19 +230,17 @@ class URLSet(List[URL]):
 		"""Return URLs that haven't failed."""
 		return next((url for url in self if not url.failed), None)
 
+	async def resolve(self) -> None:
+		"""Make sure the urls are ready to download."""
+
 	@staticmethod
 	def from_version(version: Version) -> URLSet:
 		"""Return a URLSet from an Apt Version."""
 		url_set = URLSet()
+		path = ARCHIVE_DIR / get_pkg_name(version)
+		hash_type, hashsum = get_hash(version)
 		for uri in version.uris:
-			url_set.append(
-				URL(
-					uri,
-					version.size,
-					ARCHIVE_DIR / get_pkg_name(version),
-					*get_hash(version),
-				)
-			)
+			url_set.append(URL(uri, version.size, path, "", hash_type, hashsum))
 		return url_set
 
 	@staticmethod
@@ -260,6 +283,168 @@ class URLSet(List[URL]):
 		return url_set
 
 
+class MirrorLists:
+	"""Mirror lists shared between LazyURLSets.
+
+	Sets resolve in worker threads at the same time, so each list is
+	loaded once behind its own lock. Different lists load side by side.
+	A list that failed to load fails the same way for every set.
+	"""
+
+	def __init__(self) -> None:
+		"""Mirror lists shared between LazyURLSets."""
+		self.lists: dict[str, list[str]] = {}
+		self.errors: dict[str, HTTPError | OSError] = {}
+		self.locks: dict[str, threading.Lock] = {}
+		self.lock = threading.Lock()
+
+	def get(self, key: str, load: Callable[[str], list[str]]) -> list[str]:
+		"""Return the list for key, loading it the first time."""
+		with self.lock:
+			key_lock = self.locks.setdefault(key, threading.Lock())
+		with key_lock:
+			if key in self.errors:
+				raise self.errors[key]
+			if key not in self.lists:
+				try:
+					self.lists[key] = load(key)
+				except (HTTPError, OSError) as error:
+					self.errors[key] = error
+					raise
+			return self.lists[key]
+
+
+class LazyURLSet(URLSet):
+	"""URLSet which expands its mirror uris once the download starts.
+
+	Fetching mirror lists can block, so it is put off until the
+	package is actually being downloaded.
+	"""
+
+	def __init__(
+		self,
+		template: URL,
+		uris: list[str],
+		deb_filename: str,
+		mirrors: MirrorLists,
+	) -> None:
+		"""URLSet which expands its mirror uris once the download starts."""
+		super().__init__()
+		self.template = template
+		self.uris = uris
+		self.deb_filename = deb_filename
+		self.mirrors = mirrors
+		self.resolved = False
+		# Plain uris are only string work, there's nothing to put off
+		if not any(map(is_mirror_uri, uris)):
+			self.extend(replace(template, uri=uri) for uri in self._expand())
+			self.resolved = True
+
+	def size(self) -> int:
+		"""Return the 'on disk size' for the completed download."""
+		return self.template.size
+
+	def filename(self) -> str:
+		"""Return the final portion of the filename."""
+		return self.template.filename()
+
+	def path(self) -> Path:
+		"""Return the destinateion Path object."""
+		return self.template.path
+
+	def _expand(self) -> list[str]:
+		"""Expand all of the uris into usable urls."""
+		return [
+			link
+			for uri in self.uris
+			for link in expand_uri(uri, self.deb_filename, self.mirrors)
+		]
+
+	async def resolve(self) -> None:
+		"""Expand the uris without blocking the other downloads."""
+		if self.resolved:
+			return
+		self.resolved = True
+		self.extend(
+			replace(self.template, uri=uri)
+			for uri in await to_thread.run_sync(self._expand)
+		)
+
+
+class ChunkHasher:
+	"""Hash downloaded chunks, optionally in a worker beside the download.
+
+	When threaded, chunks are queued and hashed in a worker thread so
+	hashing overlaps with the disk write and the next receive.
+	"""
+
+	def __init__(self, hash_type: str, threaded: bool = False) -> None:
+		"""Hash downloaded chunks, optionally in a worker beside the download."""
+		self.hash_fun = hashlib.new(hash_type)
+		self.queue: asyncio.Queue[bytes | None] | None = None
+		self.task: asyncio.Task[None] | None = None
+		if threaded:
+			self.queue = asyncio.Queue(maxsize=8)
+			self.task = asyncio.create_task(self._hasher(self.queue))
+
+	async def _hasher(self, queue: asyncio.Queue[bytes | None]) -> None:
+		"""Hash whatever is queued in one hop until the sentinel arrives."""
+		while True:
+			batch: list[bytes] = []
+			item = await queue.get()
+			while item is not None:
+				batch.append(item)
+				if queue.empty():
+					break
+				item = queue.get_nowait()
+			if batch:
+				await to_thread.run_sync(self.hash_batch, batch)
+			if item is None:
+				return
+
+	def hash_batch(self, batch: list[bytes]) -> None:
+		"""Update the hash with each chunk of the batch."""
+		for data in batch:
+			self.hash_fun.update(data)
+
+	async def update(self, data: bytes) -> None:
+		"""Add a chunk to the hash."""
+		if self.queue is not None:
+			await self.queue.put(data)
+			return
+		self.hash_fun.update(data)
+
+	async def hexdigest(self) -> str:
+		"""Wait for any queued chunks and return the digest."""
+		if self.queue is not None and self.task:
+			await self.queue.put(None)
+			await self.task
+		return self.hash_fun.hexdigest()
+
+	def cancel(self) -> None:
+		"""Stop the worker if one is running."""
+		if self.task:
+			self.task.cancel()
+
+
+def threaded_hash(hash_type: str) -> bool:
+	"""Return True if hashing should run beside the download instead of inline.
+
+	Hashing is only a bottleneck on boards without hardware acceleration.
+	When threaded_hash isn't set, it's only used for SHA512 on non x86 machines.
+	"""
+	# Asking with both defaults tells an explicit false apart from unset
+	if arguments.config.get_bool("threaded_hash", False):
+		return True
+	if not arguments.config.get_bool("threaded_hash", True):
+		return False
+	return hash_type == "sha512" and platform.machine() not in (
+		"x86_64",
+		"i386",
+		"i686",
+	)
+
+
 class Downloader:  # pylint: disable=too-many-instance-attributes
 	"""Manage Package Downloads."""
 
@@ -410,20 +595,43 @@ class Downloader:  # pylint: disable=too-many-instance-attributes
 				headers={"user-agent": f"nala/{__version__}"},
 			) as client:
 				loop = asyncio.get_running_loop()
-				tasks = (
+				tasks = [
 					loop.create_task(self._init_download(client, url))
 					for url in self.pkg_urls
-				)
+				]
 
 				# Setup handlers for Interrupts
 				for signal_enum in (SIGINT, SIGTERM):
 					exit_func = partial(self.interrupt, signal_enum, loop)
 					loop.add_signal_handler(signal_enum, exit_func)
 
-				return all(await gather(*tasks))
+				# Tasks only raise once the error is fatal.
+				# There is no reason to wait on the others at that point.
+				done, pending = await wait(tasks, return_when=FIRST_EXCEPTION)
+				for task in pending:
+					task.cancel()
+				await gather(*tasks, return_exceptions=True)
+				# Fatal download errors were already reported by download_error.
+				# Anything else is unexpected and has to reach download().
+				for task in done:
+					if task.cancelled() or not (error := task.exception()):
+						continue
+					if not (
+						self.fatal
+						and isinstance(error, (HTTPError, OSError, FileDownloadError))
+					):
+						raise error
+				return not self.fatal
 
 	async def _init_download(self, client: AsyncClient, urls: URLSet) -> None:
 		"""Download pkgs."""
+		try:
+			await urls.resolve()
+		# The mirror list couldn't be fetched or read, nothing to download from.
+		# That was reported once when it failed, apt_pkg can still try.
+		except (HTTPError, OSError):
+			self.failed.append(urls.filename())
+			return
 		while url := urls.next_available():
 			for url in urls:
 				if not (domain := await self._check_count(url.uri)):
@@ -444,6 +652,8 @@ class Downloader:  # pylint: disable=too-many-instance-attributes
 					url.failed = True
 					self.current[domain] -= 1
 					self.download_error(error, urls)
+					if self.fatal:
+						raise error from error
 					continue
 
 	async def _download(self, client: AsyncClient, url: URL) -> None:
@@ -456,49 +666,71 @@ class Downloader:  # pylint: disable=too-many-instance-attributes
 			)
 		)
 
-		dest = PARTIAL_DIR / url.filename()
+		dest = url.partial
 		second_attempt = False
-		while True:
-			total_data = 0
-			hash_fun = hashlib.new(url.hash_type)
-			try:
-				async with client.stream("GET", url.uri) as response:
-					response.raise_for_status()
-					async with await open_file(dest, mode="wb") as file:
-						async for data in response.aiter_bytes():
-							if data:
-								await file.write(data)
-								hash_fun.update(data)
-								total_data += len(data)
-								await self._update_progress(len(data))
-
-			# Sometimes mirrors play a little dirty and close the connection
-			except RemoteProtocolError as error:
-				await self._update_progress(total_data, failed=True)
-				if second_attempt:
-					raise error from error
-				second_attempt = True
-				dprint(f"Mirror Failed: {url.uri} {error}, will try again.")
-				continue
+		# Only a terminal failure removes the partial file.
+		# A retry reopens it with "wb" which truncates it anyway.
+		fatal = False
+		threaded = threaded_hash(url.hash_type)
+		hasher: ChunkHasher | None = None
+		try:
+			while True:
+				total_data = 0
+				hasher = ChunkHasher(url.hash_type, threaded)
+				try:
+					async with client.stream("GET", url.uri) as response:
+						response.raise_for_status()
+						async with await open_file(dest, mode="wb") as file:
+							await to_thread.run_sync(
+								preallocate, file.wrapped.fileno(), url.size
+							)
+							try:
+								async for data in response.aiter_bytes():
+									if data:
+										await file.write(data)
+										await hasher.update(data)
+										total_data += len(data)
+										await self._update_progress(len(data))
+							finally:
+								# Don't let the reserved space hide a short or failed
+								# download, apt would try to resume from the wrong size.
+								if total_data != url.size:
+									await file.truncate(total_data)
+
+				# Sometimes mirrors play a little dirty and close the connection
+				except RemoteProtocolError as error:
+					hasher.cancel()
+					await self._update_progress(total_data, failed=True)
+					if second_attempt:
+						raise error from error
+					second_attempt = True
+					dprint(f"Mirror Failed: {url.uri} {error}, will try again.")
+					continue
 
-			url.dprint(received := hash_fun.hexdigest())
-			# URL is no hash when local debs are downloaded without
-			# Specifying a hash
-			if url.no_hash:
-				vprint(f"Skipping hashsum for {url.filename()} as one wasn't provided")
+				url.dprint(received := await hasher.hexdigest())
+				# URL is no hash when local debs are downloaded without
+				# Specifying a hash
+				if url.no_hash:
+					vprint(
+						f"Skipping hashsum for {url.filename()} as one wasn't provided"
+					)
+					break
+
+				if url.hash != received:
+					fatal = self.fatal = True
+					await self._update_progress(total_data, failed=True)
+					raise FileDownloadError(
+						errno=FileDownloadError.ERRHASH,
+						filename=dest.name,
+						expected=f"{url.hash_type.upper()}: {url.hash}",
+						received=f"{url.hash_type.upper()}: {received}",
+					)
 				break
-
-			if url.hash != received:
-				dest.unlink()
-				self.fatal = True
-				await self._update_progress(total_data, failed=True)
-				raise FileDownloadError(
-					errno=FileDownloadError.ERRHASH,
-					filename=dest.name,
-					expected=f"{url.hash_type.upper()}: {url.hash}",
-					received=f"{url.hash_type.upper()}: {received}",
-				)
-			break
+		finally:
+			if hasher:
+				hasher.cancel()
+			if fatal:
+				dest.unlink(missing_ok=True)
 
 	def download_error(self, error: DownloadErrorTypes, urls: URLSet) -> None:
 		"""Handle download errors."""
@@ -562,8 +794,10 @@ def print_error(error: DownloadErrorTypes) -> None:
 		return
 	if isinstance(error, ConnectError):
 		# ConnectError: [Errno -2] Name or service not known
-		errno_replace = re.sub(ERRNO_PATTERN, "", f"{error}").strip() + ":"
-		eprint(f"{ERROR_PREFIX} {errno_replace} {error.request.url}")
+		msg = f"{error}"
+		if msg.startswith("["):
+			msg = msg.partition("] ")[2] or msg
+		eprint(f"{ERROR_PREFIX} {msg.strip()}: {error.request.url}")
 		return
 	if isinstance(error, FileDownloadError):
 		file_error(error)
@@ -658,10 +892,11 @@ def post_download_check(url: URL) -> bool:
 	"""Check if file exists, is correct, and run check hash."""
 	dprint("Post Download Package Check")
 
-	source = PARTIAL_DIR / url.filename()
+	source = url.partial
 	try:
 		dprint(f"Moving {source} -> {url.path}")
-		source.rename(url.path)
+		# Both live under the archive directory, a plain rename is all we need
+		os.rename(source, url.path)
 	except OSError as error:
 		if error.errno != ENOENT:
 			eprint(
@@ -700,14 +935,26 @@ def post_download_check(url: URL) -> bool:
 	return True
 
 
+def preallocate(fileno: int, size: int) -> None:
+	"""Reserve space for the download so it's written in as few extents as possible."""
+	if size <= 0 or not FALLOCATE:
+		return
+	# Filesystems without fallocate just get the file written as it comes.
+	# A full disk will be reported by the writes on their own.
+	FALLOCATE(fileno, 0, 0, size)
+
+
 def check_hash(url: URL) -> bool:
 	"""Check hash value."""
-	hash_fun = hashlib.new(url.hash_type)
 	with url.path.open("rb") as file:
-		while data := file.read(4096):
-			hash_fun.update(data)
+		if sys.version_info >= (3, 11):
+			received = hashlib.file_digest(file, url.hash_type).hexdigest()
+		else:
+			hash_fun = hashlib.new(url.hash_type)
+			while data := file.read(4096):
+				hash_fun.update(data)
+			received = hash_fun.hexdigest()
 
-	received = hash_fun.hexdigest()
 	url.dprint(received)
 	return received == url.hash
 
@@ -796,22 +1043,24 @@ def versions_to_urls(versions: Iterable[Version]) -> list[URLSet]:
 	"""Convert Apt Versions into urls for the downloader."""
 	urls: list[URLSet] = []
 	untrusted: list[str] = []
-	mirrors: dict[str, list[str]] = {}
+	mirrors = MirrorLists()
 	for version in versions:
-		url_set = URLSet()
-		for uri in filter_uris(version, mirrors, untrusted):
-			hash_type, hashsum = get_hash(version)
-			url_set.append(
+		hash_type, hashsum = get_hash(version)
+		urls.append(
+			LazyURLSet(
 				URL(
-					uri,
+					"",
 					version.size,
 					# Have to run the filename through a path to get the last section
 					ARCHIVE_DIR / get_pkg_name(version),
 					hash_type=hash_type,
 					hash=hashsum,
-				)
+				),
+				list(filter_uris(version, untrusted)),
+				version.filename,
+				mirrors,
 			)
-		urls.append(url_set)
+		)
 
 	if untrusted:
 		untrusted_error(untrusted)
@@ -820,9 +1069,9 @@ def versions_to_urls(versions: Iterable[Version]) -> list[URLSet]:
 
 
 def filter_uris(
-	candidate: Version, mirrors: dict[str, list[str]], untrusted: list[str]
+	candidate: Version, untrusted: list[str]
 ) -> Generator[str, None, None]:
-	"""Filter uris into usable urls."""
+	"""Filter uris and check that they are trusted."""
 	for uri in candidate.uris:
 		# Sending a file path through the downloader will cause it to lock up
 		# These have already been handled before the downloader runs.
@@ -830,54 +1079,74 @@ def filter_uris(
 			continue
 		if not check_trusted(uri, candidate):
 			untrusted.append(color(candidate.package.name, "RED"))
-		# Regex to check if we're using mirror://
-		if regex := MIRROR_PATTERN.search(uri):
-			set_mirrors_txt(domain := regex.group(1), mirrors)
-			yield from (
-				link + candidate.filename
-				for link in mirrors[domain]
-				if not link.startswith("#")
-			)
-			continue
-		# Regex to check if we're using mirror+file:/
-		if regex := MIRROR_FILE_PATTERN.search(uri):
-			if regex.group(1) not in mirrors:
-				# There are some other options in the mirror file
-				# I don't believe it's necessary to implement them
-				# So I am just splitting on whitespace.
-				# See https://gitlab.com/volian/nala/-/issues/323
-				mirrors[regex.group(1)] = discard_after_whitespace(
-					Path(regex.group(1)).read_text(encoding="utf-8").splitlines()
-				)
-
-			yield from (
-				f"{link}/{candidate.filename}"
-				for link in mirrors[regex.group(1)]
-				if not link.startswith("#")
-			)
-			continue
 		yield uri
 
 
+def expand_uri(
+	uri: str, filename: str, mirrors: MirrorLists
+) -> Generator[str, None, None]:
+	"""Expand a uri into usable urls."""
+	# Regex to check if we're using mirror://
+	if regex := MIRROR_PATTERN.search(uri):
+		yield from (
+			link + filename
+			for link in mirrors.get(regex.group(1), fetch_mirrors_txt)
+			if not link.startswith("#")
+		)
+		return
+	# Regex to check if we're using mirror+file:/
+	if regex := MIRROR_FILE_PATTERN.search(uri):
+		yield from (
+			f"{link}/{filename}"
+			for link in mirrors.get(regex.group(1), read_mirror_file)
+			if not link.startswith("#")
+		)
+		return
+	yield uri
+
+
 def discard_after_whitespace(lines: list[str]) -> list[str]:
 	"""Split on whitespace and return the very first item."""
 	return [line.split(maxsplit=1)[0] for line in lines]
 
 
-def set_mirrors_txt(domain: str, mirrors: dict[str, list[str]]) -> None:
-	"""Check if user has mirrors:// and handle accordingly."""
-	if domain not in mirrors:
-		url = f"http://{domain}"
-		try:
-			mirrors[domain] = discard_after_whitespace(
-				get(url, follow_redirects=True).text.splitlines()
-			)
-		except HTTPError:
-			sys.exit(
-				_("{error} unable to connect to {url}").format(
-					error=ERROR_PREFIX, url=url
-				)
+def is_mirror_uri(uri: str) -> bool:
+	"""Return True if the uri needs a mirror list to expand."""
+	return bool(MIRROR_PATTERN.search(uri) or MIRROR_FILE_PATTERN.search(uri))
+
+
+def fetch_mirrors_txt(domain: str) -> list[str]:
+	"""Fetch the mirror list for mirror://."""
+	url = f"http://{domain}"
+	try:
+		return discard_after_whitespace(
+			get(url, follow_redirects=True).text.splitlines()
+		)
+	except HTTPError:
+		# MirrorLists only loads this once, so this is the one report
+		eprint(
+			_("{error} unable to connect to {url}").format(error=ERROR_PREFIX, url=url)
+		)
+		raise
+
+
+def read_mirror_file(path: str) -> list[str]:
+	"""Read the mirror list for mirror+file:/."""
+	# There are some other options in the mirror file
+	# I don't believe it's necessary to implement them
+	# So I am just splitting on whitespace.
+	# See https://gitlab.com/volian/nala/-/issues/323
+	try:
+		return discard_after_whitespace(
+			Path(path).read_text(encoding="utf-8").splitlines()
+		)
+	except OSError as error:
+		eprint(
+			_("{error} unable to read {path}: {reason}").format(
+				error=ERROR_PREFIX, path=path, reason=error.strerror
 			)
+		)
+		raise
 
 
 def download(downloader: Downloader) -> None:
@@ -885,6 +1154,11 @@ def download(downloader: Downloader) -> None:
 
 	Does not return if in Download Only mode.
 	"""
+	# uvloop is optional, but much faster with many sockets open
+	with contextlib.suppress(ImportError):
+		import uvloop  # pylint: disable=import-outside-toplevel
+
+		asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 	try:
 		run(downloader.start_download())
 	except (CancelledError, RuntimeError) as error:
@@ -27,22 +27,27 @@ from __future__ import annotations
 import contextlib
 import errno
 import fcntl
+import gc
 import os
 import pty
 import re
+import select
 import signal
 import struct
 import sys
 import termios
-from time import sleep, time
+import threading
+from collections import deque
+from functools import lru_cache
+from queue import SimpleQueue
+from time import monotonic, sleep, time
 from traceback import format_exception
 from types import FrameType
-from typing import Match, TextIO
+from typing import Match, NoReturn, TextIO
 
 import apt_pkg
 from apt.progress import base, text
 from pexpect.fdpexpect import fdspawn
-from pexpect.utils import poll_ignore_interrupts
 from ptyprocess.ptyprocess import _setwinsize
 
 from nala import _, color
@@ -63,23 +68,42 @@ from nala.rich import (
 	Live,
 	Panel,
 	RenderableType,
-	Table,
 	TaskID,
+	Text,
 	Thread,
 	ascii_replace,
 	dpkg_progress,
 	from_ansi,
+	is_utf8,
 	spinner,
 	to_str,
 )
 from nala.utils import dprint, eprint, term, unit_str
 
 VERSION_PATTERN = re.compile(r"\(.*?\)")
-PARENTHESIS_PATTERN = re.compile(r"[()]")
+# One pass alternations instead of checking each message in turn
+DPKG_STATUS_PATTERN = re.compile(b"|".join(map(re.escape, DPKG_STATUS)))
+DPKG_ERROR_PATTERN = re.compile(b"|".join(map(re.escape, DPKG_ERRORS)))
+NOTICE_PATTERN = re.compile(b"|".join(map(re.escape, NOTICES)))
+SPAM_PATTERN = re.compile("|".join(map(re.escape, SPAM)))
+# 'pmstatus:pkg:percent:message' from apt
+PM_STATUS_PATTERN = re.compile(r"(pm[^:]*):([^:]*):[^:]*:(.*)")
+# 'status: pkg: state' from dpkg, sometimes with a message after it
+DPKG_STATUS_LINE_PATTERN = re.compile(r"(status[^:]*):([^:]*):([^:]*)(?::(.*))?")
+# SGR sequences from color(), they take up no room on the terminal
+SGR_PATTERN = re.compile(r"\x1b\[[0-9;]*m")
+RAW_INIT_PATTERN = re.compile(
+	b"|".join(
+		map(
+			re.escape,
+			(term.SAVE_TERM, term.ENABLE_BRACKETED_PASTE, term.ENABLE_ALT_SCREEN),
+		)
+	)
+)
 
 notice: list[str] = []
-pkgnames: set[str] = set()
-unpacked: set[str] = set()
+# What's in notice, for the duplicate check. The list keeps the order.
+notice_seen: set[str] = set()
 dpkg_error: list[str] = []
 update_error: list[str] = []
 
@@ -94,6 +118,11 @@ DOWNLOADED = _("Downloaded:")
 IGNORED = _("Ignored:")
 NO_CHANGE = _("No Change:")
 
+UPDATED_HEAD = color(UPDATED, "BLUE")
+DOWNLOADED_HEAD = color(DOWNLOADED, "BLUE")
+IGNORED_HEAD = color(IGNORED, "YELLOW")
+NO_CHANGE_HEAD = color(NO_CHANGE, "GREEN")
+
 # NOTE: Spacing of following status messages
 # NOTE: is to allow the urls to be properly aligned
 # NOTE: Especially if your status would come after the package
@@ -130,12 +159,113 @@ UNPACKING_MSG = _("{unpacking}  {dpkg_msg}")
 # NOTE: That's the end of alignment spacing
 REMOVING_MSG = _("{removing}   {dpkg_msg}")
 
+# Map dpkg prefixes to their message, format key and colored header
+DPKG_MSG_TABLE: dict[str, tuple[str, str, str]] = {
+	REMOVING: (REMOVING_MSG, "removing", REMOVING_HEAD),
+	UNPACKING: (UNPACKING_MSG, "unpacking", UNPACKING_HEAD),
+	SETTING_UP: (SETTING_UP_MSG, "setting_up", SETTING_UP_HEAD),
+	PROCESSING: (PROCESSING_MSG, "processing", PROCESSING_HEAD),
+}
+DPKG_MSG_PREFIXES = tuple(DPKG_MSG_TABLE)
+# Each prefix starts with a different letter, so once we know the line
+# has one of them its first character says which.
+DPKG_MSG_INITIALS = {prefix[0]: prefix for prefix in DPKG_MSG_PREFIXES}
+
 # NOTE: This translation is separate from the one below
 # NOTE: Because we do a check specifically on this string
 FETCHED = _("Fetched")
+FETCHED_HEAD = color(f"{FETCHED}:", "BLUE")
 # NOTE: Fetched 81.0 MB in 6s (1448 kB/s)
 FETCHED_MSG = _("{fetched} {size} in {elapsed} ({speed}/s)")
 
+# Colored once, every version gets wrapped in these
+PAREN_OPEN = color("(")
+PAREN_CLOSE = color(")")
+
+# We need to read 4096 as sometimes dpkg gives us a lot of lines at one time.
+# This is also all the line discipline holds, asking for more never gets more.
+PTY_READ_SIZE = 4096
+
+# struct winsize for the TIOCGWINSZ ioctl, rows, columns, xpixel, ypixel
+WINSIZE = struct.Struct("HHHH")
+WINSIZE_EMPTY = WINSIZE.pack(0, 0, 0, 0)
+
+# Seconds between pulse messages that we bother formatting
+PULSE_INTERVAL = 0.1
+
+# Hold at most this much raw mode output before writing it out
+RAW_BUFFER_SIZE = 65536
+
+# Same events pexpect polls the pty and stdin for
+POLL_MASK = select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR
+
+# A lower bound on a worker item in the pulse. Even " [x 1 KB]" is 9 wide,
+# staying under that means we never skip an item that would have fit.
+MIN_WORKER_WIDTH = 8
+
+
+@lru_cache(maxsize=2048)
+def size_str(val: int) -> str:
+	"""Return the stripped unit_str, cached as sizes repeat between pulses."""
+	return unit_str(val).strip()
+
+
+@lru_cache(maxsize=2048)
+def time_str(seconds: int) -> str:
+	"""Return apt's time string, cached as etas repeat between pulses."""
+	return apt_pkg.time_to_str(seconds)
+
+
+class LogBuffer:
+	"""Batch log writes so every message isn't its own write and flush.
+
+	Full batches are handed to a writer thread so the pty reader never waits on the disk.
+	"""
+
+	def __init__(self, file: TextIO, limit: int = 16384) -> None:
+		"""Batch log writes so every message isn't its own write and flush."""
+		self.file = file
+		self.limit = limit
+		self.buffer: list[str] = []
+		self.size = 0
+		self.queue: SimpleQueue[str | None] = SimpleQueue()
+		self.writer: threading.Thread | None = None
+		self.writer_pid = 0
+
+	def write(self, msg: str) -> None:
+		"""Buffer the message, handing it off once the limit is passed."""
+		self.buffer.append(msg)
+		self.size += len(msg)
+		if self.size > self.limit:
+			if self.writer is None:
+				self.writer = threading.Thread(target=self._write_queue, daemon=True)
+				self.writer_pid = os.getpid()
+				self.writer.start()
+			self.queue.put("".join(self.buffer))
+			self.buffer.clear()
+			self.size = 0
+
+	def _write_queue(self) -> None:
+		"""Write batches out until we're told to stop."""
+		while (chunk := self.queue.get()) is not None:
+			self.file.write(chunk)
+			if self.queue.empty():
+				self.file.flush()
+
+	def flush(self) -> None:
+		"""Wait on the writer, then write out anything buffered and flush the file."""
+		if self.writer is not None:
+			# A forked child doesn't have the thread, only the parent can join it
+			if self.writer_pid == os.getpid():
+				self.queue.put(None)
+				self.writer.join()
+			self.writer = None
+		if self.buffer:
+			self.file.write("".join(self.buffer))
+			self.buffer.clear()
+			self.size = 0
+		self.file.flush()
+
 
 class OpProgress(text.OpProgress):
 	"""Operation progress reporting.
@@ -177,27 +307,32 @@ class UpdateProgress(text.AcquireProgress):
 		self._width = 80
 		self.live = live
 		self.elapsed = 0.0
+		self.last_pulse = 0.0
+		# Set by SIGWINCH, see apply_winsize
+		self.winch_pending = False
+		# These don't change once we're running, save the lookups
+		self._scroll = arguments.scroll
+		self._raw_dpkg = arguments.raw_dpkg
 
 		self.live.scroll_list.clear()
 
 	def apt_write(self, msg: str, newline: bool = True, maximize: bool = False) -> None:
 		"""Write original apt update message."""
-		self._file.write("\r")
-		self._file.write(msg)
-
-		# Fill remaining stuff with whitespace
-		if self._width > len(msg):
-			self._file.write((self._width - len(msg)) * " ")
-		elif maximize:  # Needed for OpProgress.
-			self._width = max(self._width, len(msg))
-		if newline:
-			self._file.write("\n")
-		else:
+		if self.winch_pending:
+			self.apply_winsize()
+		# Pad by what shows on the terminal, not the color codes
+		width = len(SGR_PATTERN.sub("", msg)) if "\x1b" in msg else len(msg)
+		if maximize:  # Needed for OpProgress.
+			self._width = max(self._width, width)
+		# Fill remaining stuff with whitespace and write it all at once
+		pad = " " * (self._width - width)
+		self._file.write(f"\r{msg}{pad}\n" if newline else f"\r{msg}{pad}")
+		if not newline:
 			self._file.flush()
 
 	def _write(self, msg: str, newline: bool = True, maximize: bool = False) -> None:
 		"""Write the message on the terminal, fill remaining space."""
-		if arguments.raw_dpkg or not term.can_format():
+		if self._raw_dpkg or not term.can_format():
 			self.apt_write(msg, newline, maximize)
 			return
 
@@ -223,7 +358,7 @@ class UpdateProgress(text.AcquireProgress):
 		self, msg: str = "", fetched: bool = False, update_spinner: bool = False
 	) -> None:
 		"""Update wrapper for the scroll bar."""
-		if not arguments.scroll and not fetched and msg:
+		if not self._scroll and not fetched and msg:
 			print(msg)
 			return
 
@@ -237,15 +372,14 @@ class UpdateProgress(text.AcquireProgress):
 	def ims_hit(self, item: apt_pkg.AcquireItemDesc) -> None:
 		"""Call when an item is update (e.g. not modified on the server)."""
 		base.AcquireProgress.ims_hit(self, item)
-		line = NO_CHANGE_MSG.format(
-			no_change=color(NO_CHANGE, "GREEN"), info=item.description
-		)
 		if item.owner.filesize:
 			line = NO_CHANGE_SIZE_MSG.format(
-				no_change=color(NO_CHANGE, "GREEN"),
+				no_change=NO_CHANGE_HEAD,
 				info=item.description,
-				size=unit_str(item.owner.filesize).strip(),
+				size=size_str(item.owner.filesize),
 			)
+		else:
+			line = NO_CHANGE_MSG.format(no_change=NO_CHANGE_HEAD, info=item.description)
 		self._write(line)
 
 	def fail(self, item: apt_pkg.AcquireItemDesc) -> None:
@@ -253,9 +387,7 @@ class UpdateProgress(text.AcquireProgress):
 		base.AcquireProgress.fail(self, item)
 		if item.owner.status == item.owner.STAT_DONE:
 			self._write(
-				IGNORED_MSG.format(
-					ignored=color(IGNORED, "YELLOW"), info=item.description
-				)
+				IGNORED_MSG.format(ignored=IGNORED_HEAD, info=item.description)
 			)
 		else:
 			# This doesn't need to be translated. Just an error dump
@@ -267,24 +399,29 @@ class UpdateProgress(text.AcquireProgress):
 		# It's complete already (e.g. Hit)
 		if item.owner.complete:
 			return
-		line = UPDATE_MSG.format(
-			updated=color(DOWNLOADED if self.live.install else UPDATED, "BLUE"),
-			info=item.description,
-		)
+		updated = DOWNLOADED_HEAD if self.live.install else UPDATED_HEAD
 		if item.owner.filesize:
 			line = UPDATE_SIZE_MSG.format(
-				updated=color(DOWNLOADED if self.live.install else UPDATED, "BLUE"),
+				updated=updated,
 				info=item.description,
-				size=unit_str(item.owner.filesize).strip(),
+				size=size_str(item.owner.filesize),
 			)
+		else:
+			line = UPDATE_MSG.format(updated=updated, info=item.description)
 		self._write(line)
 
 	def _winch(self, *_args: object) -> None:
-		"""Signal handler for window resize signals."""
+		"""Signal handler for window resize signals, the size is read on next use."""
+		self.winch_pending = True
+
+	def apply_winsize(self) -> None:
+		"""Get the width from the terminal."""
+		self.winch_pending = False
 		if hasattr(self._file, "fileno") and os.isatty(self._file.fileno()):
-			buf = fcntl.ioctl(self._file, termios.TIOCGWINSZ, 8 * b" ")
-			dummy, columns, dummy, dummy = struct.unpack("hhhh", buf)
+			buf = fcntl.ioctl(self._file, termios.TIOCGWINSZ, WINSIZE_EMPTY)
+			_rows, columns, _x, _y = WINSIZE.unpack(buf)
 			self._width = columns - 1  # 1 for the cursor
+		self.live.slice_list()
 
 	def start(self) -> None:
 		"""Start an Acquire progress.
@@ -296,7 +433,7 @@ class UpdateProgress(text.AcquireProgress):
 		self.elapsed = time()
 		self._signal = signal.signal(signal.SIGWINCH, self._winch)
 		# Get the window size.
-		self._winch()
+		self.apply_winsize()
 		self._id = 1
 
 	def final_msg(self) -> str:
@@ -309,8 +446,8 @@ class UpdateProgress(text.AcquireProgress):
 		return color(
 			FETCHED_MSG.format(
 				fetched=FETCHED,
-				size=unit_str(int(self.fetched_bytes)).strip(),
-				elapsed=apt_pkg.time_to_str(elapsed_time),
+				size=size_str(int(self.fetched_bytes)),
+				elapsed=time_str(elapsed_time),
 				speed=to_str(int(fetched_speed), 1000).strip(),
 			)
 		)
@@ -333,6 +470,13 @@ class UpdateProgress(text.AcquireProgress):
 		if hasattr(self._file, "fileno") and not os.isatty(self._file.fileno()):
 			return True
 
+		# The display only refreshes a few times a second, don't format faster
+		if (now := monotonic()) - self.last_pulse < PULSE_INTERVAL:
+			return True
+		self.last_pulse = now
+		if self.winch_pending:
+			self.apply_winsize()
+
 		# calculate progress
 		percent = ((self.current_bytes + self.current_items) * 100.0) / (
 			self.total_bytes + self.total_items
@@ -343,19 +487,24 @@ class UpdateProgress(text.AcquireProgress):
 		end = ""
 		if self.current_cps:
 			eta = int((self.total_bytes - self.current_bytes) / self.current_cps)
-			end = f" {unit_str(int(self.current_cps)).strip()}/s {apt_pkg.time_to_str(eta)}"
+			end = f" {size_str(int(self.current_cps))}/s {time_str(eta)}"
 
+		# Room left for the worker items
+		budget = self._width - 5 - len(end)
 		for worker in owner.workers:
 			val = ""
 			if not worker.current_item:
 				if worker.status:
 					val = f" [{worker.status}]"
-					if len(tval) + len(val) + len(end) >= self._width - 5:
+					if len(tval) + len(val) >= budget:
 						break
 					tval += val
 					shown = True
 				continue
 			shown = True
+			# Don't bother formatting an item that can't possibly fit
+			if len(tval) + MIN_WORKER_WIDTH >= budget:
+				break
 
 			if worker.current_item.owner.id:
 				val += (
@@ -366,18 +515,18 @@ class UpdateProgress(text.AcquireProgress):
 			if worker.current_item.owner.active_subprocess:
 				val += f" {worker.current_item.owner.active_subprocess}"
 
-			val += f" {unit_str(worker.current_size).strip()}"
+			val += f" {size_str(worker.current_size)}"
 
 			# Add the total size and percent
 			if worker.total_size and not worker.current_item.owner.complete:
 				val += (
-					f"/{unit_str(worker.total_size).strip()}"
+					f"/{size_str(worker.total_size)}"
 					f" {(worker.current_size * 100.0) / worker.total_size:.0f}%"
 				)
 
 			val += "]"
 
-			if len(tval) + len(val) + len(end) >= self._width - 5:
+			if len(tval) + len(val) >= budget:
 				# Display as many items as screen width
 				break
 			tval += val
@@ -408,23 +557,57 @@ class InstallProgress(base.InstallProgress):
 		dprint("Init InstallProgress")
 		base.InstallProgress.__init__(self)
 		self.task = task
-		self._dpkg_log = dpkg_log
-		self._term_log = term_log
+		self._dpkg_log = LogBuffer(dpkg_log)
+		self._term_log = LogBuffer(term_log)
 		self.live = live
 		self.config_purge = config_purge
+		self.purge_pattern = (
+			re.compile("|".join(map(re.escape, config_purge))) if config_purge else None
+		)
 		self.raw = False
 		self.last_line = b""
+		self.last_status = b""
+		# What we put on the spinner for last_status, others change it too
+		self.status_text: Text | None = None
+		# Holds a partial status line until the rest of it is read
+		self.status_buffer = ""
+		# Packages counted once unpacked, and again once set up
+		self.unpacked: set[str] = set()
+		self.pkgnames: set[str] = set()
+		# Advances counted while reading the status fd, see refresh_progress
+		self.advance_pending = 0
+		# Raw mode output is written when we run out of it, not per chunk
+		self.raw_buffer = bytearray()
+		# Set by SIGWINCH, see apply_winsize
+		self.winch_pending = False
 		self.child: AptExpect
 		self.child_fd: int
 		self.child_pid: int
+		# These don't change once we're running, save the lookups
+		self._scroll = arguments.scroll
+		self._raw_dpkg = arguments.raw_dpkg
+		self.noninteractive = os.environ.get("DEBIAN_FRONTEND") == "noninteractive"
+		# repr of every chunk adds up, let people turn it off
+		self._raw_log = arguments.config.get_bool("dpkg_raw_log", True)
+		self._debug = arguments.debug
+		# Extra dpkg options for when we run it ourselves for local debs
+		self.dpkg_options: tuple[str, ...] = ()
+		if arguments.config.get_bool("dpkg_unsafe_io"):
+			# Don't fsync every unpacked file, faster but not safe from a crash
+			arguments.config.apt.set("DPkg::Options::", "--force-unsafe-io")
+			self.dpkg_options = ("--force-unsafe-io",)
+		self.progress_panel = Panel.fit(
+			"", border_style="bold green", padding=(0, 0)
+		)
 		# Setting environment to xterm seems to work fine for linux terminal
 		# I don't think we will be supporting much more this this, at least for now
-		if not term.is_xterm() and not arguments.raw_dpkg:
+		if not term.is_xterm() and not self._raw_dpkg:
 			os.environ["TERM"] = "xterm"
 
 	def finish_update(self) -> None:
 		"""Call when update has finished."""
-		if not arguments.raw_dpkg:
+		self.flush_logs()
+		if not self._raw_dpkg:
 			dpkg_progress.advance(self.task)
 			self.live.scroll_bar()
 
@@ -434,8 +617,22 @@ class InstallProgress(base.InstallProgress):
 		returns the result of calling `obj.do_install()`
 		"""
 		dprint("Forking")
+		# Anything still buffered would be written by both processes
+		self.flush_logs()
+		# Move everything we have to the permanent generation so our collections
+		# don't write to, and copy, the pages we share with the child.
+		# The child doesn't collect at all. We stay frozen until it's done.
+		gc.freeze()
+		try:
+			return self.fork_install(apt)
+		finally:
+			gc.unfreeze()
+
+	def fork_install(self, apt: apt_pkg.PackageManager | list[str]) -> int:
+		"""Fork the install and follow it until the child exits."""
 		pid, self.child_fd = fork()
 		if pid == 0:
+			gc.disable()
 			try:
 				# PEP-446 implemented in Python 3.4 made all descriptors
 				# CLOEXEC, but we need to be able to pass writefd to dpkg
@@ -445,19 +642,22 @@ class InstallProgress(base.InstallProgress):
 					# pylint: disable=subprocess-run-check
 					self.dpkg_log("Command Execution:\n")
 					self.dpkg_log(f"Command = {apt}\n\n")
-					os._exit(
-						os.spawnlp(  # nosec
-							os.P_WAIT,
-							"dpkg",
+					self.flush_logs()
+					# Replace the child rather than forking it again to wait on dpkg
+					os.execvp(  # nosec
+						"dpkg",
+						(
 							"dpkg",
 							"--status-fd",
 							f"{self.write_stream.fileno()}",
+							*self.dpkg_options,
 							"-i",
 							*apt,
-						)
+						),
 					)
 				# We ignore this with mypy because the attr is there
 				self.dpkg_log("Apt Do Install\n\n")
+				self.flush_logs()
 				os._exit(apt.do_install(self.write_stream.fileno()))  # type: ignore[attr-defined]
 			# We need to catch every exception here.
 			# If we don't the code continues in the child,
@@ -465,84 +665,116 @@ class InstallProgress(base.InstallProgress):
 			except Exception:  # pylint: disable=broad-except
 				exception = format_exception(*sys.exc_info())
 				self.dpkg_log(f"{exception}\n")
+				self.flush_logs()
 				os._exit(1)
 
 		dprint("Dpkg Forked")
 		self.child_pid = pid
-		if arguments.raw_dpkg:
+		if self._raw_dpkg:
 			return os.WEXITSTATUS(self.wait_child())
 		# We use fdspawn from pexpect to interact with our dpkg pty
 		# But we also subclass it to give it the interact method and setwindow
 		self.child = AptExpect(self.child_fd, timeout=None)
 
 		signal.signal(signal.SIGWINCH, self.sigwinch_passthrough)
-		self.child.interact(self)
+		old_sigterm = signal.signal(signal.SIGTERM, self.sigterm)
+		try:
+			self.child.interact(self)
+		finally:
+			signal.signal(signal.SIGTERM, old_sigterm)
+			self.flush_raw()
+			# Make sure the logs survive if anything goes wrong
+			self.flush_logs()
 		return os.WEXITSTATUS(self.wait_child())
 
+	def sigterm(self, _sig_dummy: int, _data_dummy: FrameType | None) -> NoReturn:
+		"""Stop dpkg, then exit by unwinding so the buffered logs are written."""
+		from nala.error import (  # pylint: disable=cyclic-import, import-outside-toplevel
+			ExitCode,
+		)
+
+		# The child leads its own session from the pty fork, so signal
+		# the whole group. That reaches dpkg even when apt started it.
+		with contextlib.suppress(ProcessLookupError):
+			os.killpg(self.child_pid, signal.SIGTERM)
+		with contextlib.suppress(ChildProcessError):
+			os.waitpid(self.child_pid, 0)
+		sys.exit(ExitCode.SIGTERM)
+
 	def sigwinch_passthrough(
 		self, _sig_dummy: int, _data_dummy: FrameType | None
 	) -> None:
-		"""Pass through sigwinch signals to dpkg."""
-		buffer = struct.pack("HHHH", 0, 0, 0, 0)
-		term_size = struct.unpack(
-			"hhhh", fcntl.ioctl(term.STDIN, termios.TIOCGWINSZ, buffer)
+		"""Note the resize, the interact loop passes it on to dpkg."""
+		self.winch_pending = True
+
+	def apply_winsize(self) -> None:
+		"""Pass the terminal size through to dpkg."""
+		self.winch_pending = False
+		rows, columns, _x, _y = WINSIZE.unpack(
+			fcntl.ioctl(term.STDIN, termios.TIOCGWINSZ, WINSIZE_EMPTY)
 		)
 		if self.child.isalive():
 			with contextlib.suppress(ValueError):
-				_setwinsize(self.child_fd, term_size[0], term_size[1])
+				_setwinsize(self.child_fd, rows, columns)
+		self.live.slice_list()
 
 	def dpkg_log(self, msg: str) -> None:
-		"""Write to dpkg-debug.log and flush."""
+		"""Write to dpkg-debug.log."""
 		self._dpkg_log.write(msg)
-		self._dpkg_log.flush()
 
-	def term_log(self, msg: bytes) -> None:
-		"""Write to term.log and flush."""
-		self._term_log.write(f"{msg.decode('utf-8').strip()}\n")
+	def term_log(self, msg: str) -> None:
+		"""Write to term.log."""
+		self._term_log.write(f"{msg}\n")
+
+	def flush_logs(self) -> None:
+		"""Flush dpkg-debug.log and term.log."""
+		self._dpkg_log.flush()
 		self._term_log.flush()
 
 	def dpkg_status(self, data: bytes) -> bool:
 		"""Handle any status messages."""
-		for status in DPKG_STATUS:
-			if status in data:
-				statuses = data.split(b"\r")
-				if len(statuses) > 2:
-					self.dpkg_log(f"Status_Split = {repr(statuses)}\n")
-				for msg in statuses:
-					if msg != b"":
-						spinner.text = from_ansi(color(msg.decode().strip()))
-						self.live.scroll_bar(update_spinner=True)
-				self.dpkg_log(term.LF.decode())
-				return True
-		return False
+		if not DPKG_STATUS_PATTERN.search(data):
+			return False
+		if self._raw_log and data.count(b"\r") > 1:
+			self.dpkg_log(f"Status_Split = {repr(data.split(term.CR))}\n")
+		# Only the last status would be left on the spinner anyway, and dpkg
+		# likes to repeat them so skip it if it's still what the spinner shows.
+		msg = data.rstrip(b"\r").rpartition(b"\r")[2]
+		if msg and (msg != self.last_status or spinner.text is not self.status_text):
+			self.last_status = msg
+			spinner.text = self.status_text = from_ansi(color(msg.decode().strip()))
+			self.live.scroll_bar(update_spinner=True)
+		self.dpkg_log("\n")
+		return True
 
 	def read_status(self) -> None:
 		"""Read the status fd and send it to update progress bar."""
 		try:
-			status = self.status_stream.read(1024)
+			status = self.status_stream.read(65536)
 		except OSError as err:
 			# Resource temporarily unavailable is ignored
 			if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
 				print(err.strerror)
 			return
-		for line in status.splitlines():
+		if not status:
+			return
+		# A read can end in the middle of a line, keep that part for next time
+		lines = (self.status_buffer + status).split("\n")
+		self.status_buffer = lines.pop()
+		for line in lines:
 			self.update_progress_bar(line)
+		# One read can finish several packages, only redraw for them once
+		self.refresh_progress()
 
 	def update_progress_bar(self, line: str) -> None:
 		"""Update the interface."""
-		pkgname = status = status_str = _percent = base_status = ""
+		pkgname = status = status_str = base_status = ""
 
-		if line.startswith("pm"):
-			try:
-				(status, pkgname, _percent, status_str) = line.split(":", 3)
-			except ValueError:
-				# Silently ignore lines that can't be parsed
-				return
-		elif line.startswith("status"):
-			try:
-				(base_status, pkgname, status, status_str) = line.split(":", 3)
-			except ValueError:
-				(base_status, pkgname, status) = line.split(":", 2)
+		if match := PM_STATUS_PATTERN.match(line):
+			status, pkgname, status_str = match.groups()
+		elif match := DPKG_STATUS_LINE_PATTERN.match(line):
+			base_status, pkgname, status, status_str = match.groups("")
+		# Lines that can't be parsed match neither and are silently ignored
 
 		# Always strip the status message
 		pkgname = pkgname.strip()
@@ -551,126 +783,153 @@ class InstallProgress(base.InstallProgress):
 
 		# This is the main branch for apt installs
 		if status == "pmstatus":
-			dprint(f"apt: {pkgname} {status_str}")
+			if self._debug:
+				dprint(f"apt: {pkgname} {status_str}")
 			if status_str.startswith(("Unpacking", "Removing")):
-				unpacked.add(pkgname)
+				self.unpacked.add(pkgname)
 				self.advance_progress()
 			# Either condition can satisfy this mark provided the package hasn't been advanced
 			elif (
 				status_str.startswith(("Installed", "Configuring"))
-				and pkgname not in pkgnames
-				and pkgname in unpacked
+				and pkgname not in self.pkgnames
+				and pkgname in self.unpacked
 			):
-				pkgnames.add(pkgname)
+				self.pkgnames.add(pkgname)
 				self.advance_progress()
 		# This branch only happens for local .deb installs.
 		elif base_status == "status":
 			# Sometimes unpacked is notified twice for one package
-			# We check against out set to make sure not to over shoot progress
-			if status == "unpacked" and pkgname not in pkgnames:
+			# We check against our set to make sure not to over shoot progress
+			if status == "unpacked" and pkgname not in self.pkgnames:
 				self.advance_progress()
-				pkgnames.add(pkgname)
+				self.pkgnames.add(pkgname)
 			# Sometimes packages are notified as installed
 			# But we only care for ones that have been unpacked
-			if status == "installed" and pkgname in pkgnames:
+			if status == "installed" and pkgname in self.pkgnames:
 				self.advance_progress()
-			dprint(f"dpkg: {pkgname} {status}")
+			if self._debug:
+				dprint(f"dpkg: {pkgname} {status}")
 
 	def pre_filter(self, data: bytes) -> None:
 		"""Filter data from interact."""
-		self.read_status()
+		# The progress bar isn't up while something else has the terminal,
+		# the status is caught up on once we leave raw mode.
+		if not self.raw:
+			self.read_status()
 
 		# This is a work around for a hang in non-interactive mode
 		# https://github.com/liske/needrestart/issues/129
-		if (
-			os.environ.get("DEBIAN_FRONTEND") == "noninteractive"
-			and b"[Return]" in data
-		):
+		if self.noninteractive and b"[Return]" in data:
 			os.write(self.child_fd, term.CRLF)
 
 		# Save Term and Alt Screen for debconf and Bracked Paste for the start of the shell
-		if (
-			term.SAVE_TERM in data
-			or term.ENABLE_BRACKETED_PASTE in data
-			or term.ENABLE_ALT_SCREEN in data
-		):
+		if RAW_INIT_PATTERN.search(data):
 			self.raw_init()
 
-		self.dpkg_log(f"Raw = {self.raw}: [{repr(data)}]\n")
+		if self._raw_log:
+			self.dpkg_log(f"Raw = {self.raw}: [{repr(data)}]\n")
 
-		if not self.raw and self.dpkg_status(data):
+		if self.raw:
+			# Debconf and friends have the terminal, just pass it through
+			self.dpkg_log("\n")
+			self.rawline_handler(data)
+			return
+		if self.dpkg_status(data):
 			return
 		self.format_dpkg_output(data)
 
 	def format_dpkg_output(self, rawline: bytes) -> None:
 		"""Facilitate what needs to happen to dpkg output."""
 		# If we made it here that means we're okay to start a new line in the log
-		self.dpkg_log(term.LF.decode())
+		self.dpkg_log("\n")
 
-		if self.raw:
-			self.rawline_handler(rawline)
-			return
-
-		line = ascii_replace(rawline.decode().strip())
+		# Decode once, term.log wants the line before any ascii replacement
+		# and the line count below wants it before it's stripped.
+		text = rawline.decode("utf-8", "replace")
+		decoded = text.strip()
+		# ascii_replace checks isascii itself, only call it when it can matter
+		line = decoded if is_utf8 else ascii_replace(decoded)
 
 		if check_line_spam(line, rawline, self.last_line):
 			return
 
 		if (
-			self.config_purge
+			self.purge_pattern
 			and "Purging configuration files" in line
-			and any(pkg in line for pkg in self.config_purge)
+			and self.purge_pattern.search(line)
 		):
 			self.advance_progress()
+			self.refresh_progress()
 
-		self.term_log(rawline)
+		self.term_log(decoded)
 
 		# We need to split up large lines and handle them individually.
-		if rawline.count(b"\r\n") > 1:
-			data_split = rawline.strip().split(b"\r\n")
-			error = data_split[0].decode() in dpkg_error
-			self.dpkg_log(f"Data_Split = {repr(data_split)}\n")
-			for new_line in data_split:
-				if not new_line:
-					continue
-				check_error(rawline, new_line.decode(), error)
-				self.format_write(new_line.decode(), rawline)
+		if text.count("\r\n") > 1:
+			self.split_data(rawline, decoded.split("\r\n"))
 			return
 		self.format_write(line, rawline)
 
+	def split_data(self, rawline: bytes, parts: list[str]) -> None:
+		"""Handle the lines of a chunk that was split up individually."""
+		if self._raw_log:
+			self.dpkg_log(f"Data_Split = {repr(parts)}\n")
+		error = parts[0] in dpkg_error
+		for new_line in parts:
+			if not new_line:
+				continue
+			check_error(rawline, new_line, error)
+			self.format_write(new_line, rawline)
+
 	def format_write(self, line: str, rawline: bytes) -> None:
 		"""Format the line if and handle writing it to the terminal."""
 		# Main format section for making things pretty
 		msg = msg_formatter(line)
 		# If verbose we just send it. No bars
-		if not arguments.scroll:
-			print(msg)
+		if not self._scroll:
+			print(msg, flush=True)
 			self.live.scroll_bar()
 		elif "Fetched:" in msg:
 			# This is some magic for apt-listdifferences to put
 			# the fetched message in the spinner since it gets spammy
-			spinner.text = from_ansi(color(" ".join(line.split()[1:])))
+			spinner.text = from_ansi(color(line.partition(" ")[2]))
 			self.live.scroll_bar(msg, update_spinner=True)
 		else:
 			self.live.scroll_bar(msg)
-		if (stdout := sys.stdout) is not None:
-			stdout.flush()
 		self.set_last_line(rawline)
 
 	def rawline_handler(self, rawline: bytes) -> None:
 		"""Handle text operations for rawline."""
-		term.write(rawline)
+		self.raw_buffer += rawline
+		if len(self.raw_buffer) >= RAW_BUFFER_SIZE:
+			self.flush_raw()
 		# Once we write we can check if we need to pop out of raw mode
 		if (
 			term.RESTORE_TERM in rawline
 			or term.DISABLE_ALT_SCREEN in rawline
 			# Fix for Dialog Debconf Frontend https://gitlab.com/volian/nala/-/issues/211
 		) and term.ENABLE_ALT_SCREEN not in rawline:
+			self.flush_raw()
+			self.flush_logs()
 			self.raw = False
 			term.restore_mode()
 			self.live.start()
+			self.read_status()
 		self.set_last_line(rawline)
 
+	def flush_raw(self) -> None:
+		"""Write out the raw output being held for the terminal."""
+		if not self.raw_buffer:
+			return
+		# A signal can cut a write to the tty short, keep going until it's all out
+		view = memoryview(self.raw_buffer)
+		try:
+			while view:
+				view = view[os.write(term.STDOUT, view) :]
+		finally:
+			# The buffer can't be cleared while a view of it is still held
+			view.release()
+		self.raw_buffer.clear()
+
 	def set_last_line(self, rawline: bytes) -> None:
 		"""Set the current line to last line if there is no backspace."""
 		# When at the conf prompt if you press Y, then backspace, then hit enter
@@ -679,22 +938,25 @@ class InstallProgress(base.InstallProgress):
 			self.last_line = rawline
 
 	def advance_progress(self) -> None:
-		"""Advance the dpkg progress bar."""
-		dpkg_progress.advance(self.task)
-		if not arguments.scroll:
-			self.live.update(
-				Panel.fit(
-					dpkg_progress.get_renderable(),
-					border_style="bold green",
-					padding=(0, 0),
-				),
-				refresh=True,
-			)
+		"""Count an advance of the dpkg progress bar for refresh_progress."""
+		self.advance_pending += 1
+
+	def refresh_progress(self) -> None:
+		"""Advance the dpkg progress bar by everything counted since last time."""
+		if not self.advance_pending:
+			return
+		dpkg_progress.advance(self.task, self.advance_pending)
+		self.advance_pending = 0
+		if not self._scroll:
+			# Only the progress inside changes, the panel can be reused
+			self.progress_panel.renderable = dpkg_progress.get_renderable()
+			self.live.update(self.progress_panel, refresh=True)
 
 	def raw_init(self) -> None:
 		"""Initialize raw terminal output."""
 		if self.raw:
 			return
+		self.flush_logs()
 		self.live.raw_init()
 		term.set_raw()
 		self.raw = True
@@ -702,15 +964,16 @@ class InstallProgress(base.InstallProgress):
 
 def check_line_spam(line: str, rawline: bytes, last_line: bytes) -> bool:
 	"""Check for, and handle, notices and spam."""
-	for message in NOTICES:
-		if message in rawline and line not in notice:
-			notice.append(line)
-			return False
+	# The pattern rules out most lines, only then look through what we have
+	if NOTICE_PATTERN.search(rawline) and line not in notice_seen:
+		notice_seen.add(line)
+		notice.append(line)
+		return False
 	if b"but it can still be activated by:" in last_line:
 		notice.append(f"  {line}")
 		return False
 
-	return any(item in line for item in SPAM)
+	return SPAM_PATTERN.search(line) is not None
 
 
 def check_error(data: bytes, line: str, error_in_list: bool = False) -> None:
@@ -718,15 +981,9 @@ def check_error(data: bytes, line: str, error_in_list: bool = False) -> None:
 	# Check so we don't duplicate error messages
 	if error_in_list:
 		return
-	for error in DPKG_ERRORS:
-		# Make sure that the error is not spam
-		if error in data and all(item not in line for item in SPAM):
-			dpkg_error.append(line)
-
-
-def paren_color(match: Match[str]) -> str:
-	"""Color parenthesis."""
-	return color("(") if match.group(0) == "(" else color(")")
+	# Make sure that the error is not spam
+	if DPKG_ERROR_PATTERN.search(data) and not SPAM_PATTERN.search(line):
+		dpkg_error.append(line)
 
 
 def line_replace(line: str, header: str) -> str:
@@ -734,65 +991,43 @@ def line_replace(line: str, header: str) -> str:
 	return line.replace(header, "").strip()
 
 
-def format_version(match: list[str], line: str) -> str:
-	"""Format version numbers."""
-	for ver in match:
-		version = ver[1:-1]
-		if version and version[0].isdigit():
-			new_ver = ver.replace(version, color(version, "BLUE"))
-			new_ver = re.sub(PARENTHESIS_PATTERN, paren_color, new_ver)
-			line = line.replace(ver, new_ver)
-	return line
-
-
-def fill_pulse(pulse: list[str]) -> str:
-	"""Fill the pulse message."""
-	last = len(pulse) - 1
-	fill = sum(len(line) for line in pulse) + last
-	# Set fill width to fit inside the rich panel
-	fill = (term.columns - fill) - 5 if arguments.verbose else (term.columns - fill) - 7
-	# Minus 2 more to account for ascii simpleDots on the spinner
-	if term.console.options.ascii_only:
-		fill -= 2
-	# Make sure we insert the filler in the right spot
-	# In case of extra 1 min as shown below.
-	# ['2407', 'kB/s', '30s']
-	# ['895', 'kB/s', '1min', '18s']
-	index = last - 2
-	if "/s" in pulse[index]:
-		index = last - 3
-
-	pulse.insert(index, " " * fill)
-	return " ".join(pulse)
+@lru_cache(maxsize=4096)
+def color_version_token(ver: str) -> str:
+	"""Color a version token such as '(7.1.0-3)'.
+
+	The same versions show up in the unpack, setup and trigger lines,
+	so the colored result is cached.
+	"""
+	return f"{PAREN_OPEN}{color(ver[1:-1], 'BLUE')}{PAREN_CLOSE}"
+
+
+def version_repl(match: Match[str]) -> str:
+	"""Color the matched version if it is one."""
+	ver = match.group(0)
+	return color_version_token(ver) if ver[1:2].isdigit() else ver
+
+
+def format_version(line: str) -> str:
+	"""Format version numbers.
+
+	Such as 'Unpacking neofetch (7.1.0-3) over (7.1.0-2)'
+	"""
+	return VERSION_PATTERN.sub(version_repl, line)
 
 
 def msg_formatter(line: str) -> str:
 	"""Format dpkg output."""
 	if line.endswith("..."):
-		line = line.replace("...", "")
+		line = line[:-3]
 
-	if line.startswith(REMOVING):
-		line = REMOVING_MSG.format(
-			removing=REMOVING_HEAD, dpkg_msg=line_replace(line, REMOVING)
-		)
-	elif line.startswith(UNPACKING):
-		line = UNPACKING_MSG.format(
-			unpacking=UNPACKING_HEAD, dpkg_msg=line_replace(line, UNPACKING)
-		)
-	elif line.startswith(SETTING_UP):
-		line = SETTING_UP_MSG.format(
-			setting_up=SETTING_UP_HEAD, dpkg_msg=line_replace(line, SETTING_UP)
-		)
-	elif line.startswith(PROCESSING):
-		line = PROCESSING_MSG.format(
-			processing=PROCESSING_HEAD, dpkg_msg=line_replace(line, PROCESSING)
-		)
+	if line.startswith(DPKG_MSG_PREFIXES):
+		prefix = DPKG_MSG_INITIALS[line[0]]
+		msg, key, header = DPKG_MSG_TABLE[prefix]
+		line = msg.format(**{key: header, "dpkg_msg": line_replace(line, prefix)})
 	elif line.startswith(GET):
-		line = f"{color(f'{FETCHED}:', 'BLUE')} {' '.join(line.split()[1:])}"
+		line = f"{FETCHED_HEAD} {line.partition(' ')[2]}"
 
-	if match := re.findall(VERSION_PATTERN, line):
-		return format_version(match, line)
-	return line
+	return format_version(line) if "(" in line else line
 
 
 class DpkgLive(Live):
@@ -802,9 +1037,24 @@ class DpkgLive(Live):
 		"""Subclass for dpkg live display."""
 		super().__init__(auto_refresh=False, refresh_per_second=4)
 		self.install = install
-		self.scroll_list: list[str] = []
+		# Asking the terminal for its size is a syscall, so this only
+		# changes when we get SIGWINCH or rerender.
+		self.max_lines = self.scroll_lines()
+		self.scroll_list: deque[str] = deque(maxlen=self.max_lines)
 		self.scroll_config = (False, False, True)
 		self.used_scroll: bool = False
+		self.ansi_cache: dict[str, Text] = {}
+		self.titles: dict[tuple[bool, bool], str] = {}
+		self._scroll = arguments.scroll
+		# Only what's inside these panels changes, so reuse them
+		self.bar_panel = Panel(
+			"",
+			padding=(0, 0),
+			border_style="bold blue" if self._scroll else "bold green",
+		)
+		self.scroll_panel = Panel(
+			"", title_align="left", padding=(0, 0), border_style="bold green"
+		)
 
 	def __enter__(self) -> DpkgLive:
 		"""Start the live display."""
@@ -824,44 +1074,51 @@ class DpkgLive(Live):
 			if not self.used_scroll:
 				return
 			apt_fetch, update_spinner, use_bar = self.scroll_config
+			self.slice_list()
 		else:
 			self.used_scroll = True
 			self.scroll_config = (apt_fetch, update_spinner, use_bar)
 
 		if msg:
 			self.scroll_list.append(msg)
-		self.slice_list()
 
-		table = Table.grid()
-		table.add_column(no_wrap=True, width=term.columns, overflow=OVERFLOW)
-
-		for item in self.scroll_list:
-			table.add_row(from_ansi(item))
+		# The lines are cached Text set up to crop themselves,
+		# so there's no need to lay them out in a new table every time
+		lines: list[RenderableType] = [
+			self.ansi_text(item) for item in self.scroll_list
+		]
 
 		if use_bar or update_spinner:
-			table.add_row(
-				Panel(
-					self.get_group(update_spinner, use_bar),
-					padding=(0, 0),
-					border_style="bold blue" if arguments.scroll else "bold green",
-				)
-			)
+			self.bar_panel.renderable = self.get_group(update_spinner, use_bar)
+			lines.append(self.bar_panel)
 
-		# We don't need to build the extra panel if we're not scrolling
-		if not arguments.scroll:
-			self.update(table, refresh=True)
+		group = Group(*lines)
+		# We don't need the extra panel if we're not scrolling
+		if not self._scroll:
+			self.update(group, refresh=True)
 			return
 
-		self.update(
-			Panel(
-				table,
-				title=self.get_title(self.install, apt_fetch),
-				title_align="left",
-				padding=(0, 0),
-				border_style="bold green",
-			),
-			refresh=True,
-		)
+		self.scroll_panel.renderable = group
+		self.scroll_panel.title = self.cached_title(apt_fetch)
+		self.update(self.scroll_panel, refresh=True)
+
+	def ansi_text(self, item: str) -> Text:
+		"""Return the Text for a scroll line, converting it only once."""
+		if (text := self.ansi_cache.get(item)) is None:
+			# Lines that have scrolled away aren't needed anymore
+			if len(self.ansi_cache) > 4 * self.max_lines:
+				self.ansi_cache.clear()
+			text = self.ansi_cache[item] = from_ansi(item)
+			text.no_wrap = True
+			text.overflow = OVERFLOW
+		return text
+
+	def cached_title(self, apt_fetch: bool) -> str:
+		"""Get the title for our panel, only working it out once."""
+		key = (self.install, apt_fetch)
+		if (title := self.titles.get(key)) is None:
+			title = self.titles[key] = self.get_title(*key)
+		return title
 
 	@staticmethod
 	def get_title(install: bool, apt_fetch: bool) -> str:
@@ -901,13 +1158,19 @@ class DpkgLive(Live):
 
 		return dpkg_progress.get_renderable()
 
+	@staticmethod
+	def scroll_lines() -> int:
+		"""Return how many lines the scroll bar should keep."""
+		return max(term.lines // 2, 10)
+
 	def slice_list(self) -> None:
-		"""Set scroll bar to take up only 1/2 of the screen."""
-		scroll_lines = term.lines // 2
-		size = len(self.scroll_list)
-		if size > scroll_lines and size > 10:
-			total = size - max(scroll_lines, 10)
-			self.scroll_list = self.scroll_list[total:]
+		"""Set scroll bar to take up only 1/2 of the screen.
+
+		The deque drops old lines itself, this only resizes it with the terminal.
+		"""
+		if (scroll_lines := self.scroll_lines()) != self.max_lines:
+			self.max_lines = scroll_lines
+			self.scroll_list = deque(self.scroll_list, maxlen=scroll_lines)
 
 	def raw_init(self) -> None:
 		"""Set up the live display to be stopped."""
@@ -975,28 +1238,55 @@ class AptExpect(fdspawn):  # type: ignore[misc]
 
 	def interact_copy(self, install_progress: InstallProgress) -> None:
 		"""Interact with the pty."""
-		while self.isalive():
-			try:
-				ready = poll_ignore_interrupts([self.child_fd, term.STDIN])
-				if self.child_fd in ready and not self._read(install_progress):
-					break
-				if term.STDIN in ready:
-					self._write(install_progress)
-			except KeyboardInterrupt:
-				term.write(term.CURSER_UP + term.CLEAR_LINE)
-				eprint(
-					_("{warning} Quitting now could break your system!").format(
-						warning=WARNING_PREFIX
+		# Register once instead of building a new poll object every loop
+		poller = select.poll()
+		for fd in (self.child_fd, term.STDIN):
+			poller.register(fd, POLL_MASK)
+		# Signals write to this pipe so a resize wakes us up from poll
+		wake_read, wake_write = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+		old_wakeup = signal.set_wakeup_fd(wake_write, warn_on_full_buffer=False)
+		poller.register(wake_read, select.POLLIN)
+		try:
+			while self.isalive():
+				try:
+					# Only block once everything ready has been read,
+					# so raw output goes to the terminal in one write.
+					if not (events := poller.poll(0)):
+						install_progress.flush_raw()
+						events = poller.poll()
+					ready = [fd for fd, _event in events]
+					if wake_read in ready:
+						self._winch(wake_read, install_progress)
+					if self.child_fd in ready and not self._read(install_progress):
+						break
+					if term.STDIN in ready:
+						self._write(install_progress)
+				except KeyboardInterrupt:
+					term.write(term.CURSER_UP + term.CLEAR_LINE)
+					eprint(
+						_("{warning} Quitting now could break your system!").format(
+							warning=WARNING_PREFIX
+						)
 					)
-				)
-				eprint(color(_("Ctrl+C twice quickly will exit") + ELLIPSIS, "RED"))
-				sleep(0.5)
+					eprint(color(_("Ctrl+C twice quickly will exit") + ELLIPSIS, "RED"))
+					sleep(0.5)
+		finally:
+			signal.set_wakeup_fd(old_wakeup)
+			os.close(wake_read)
+			os.close(wake_write)
+
+	@staticmethod
+	def _winch(wake_read: int, install_progress: InstallProgress) -> None:
+		"""Pass on a resize once, however many signals came in."""
+		with contextlib.suppress(BlockingIOError):
+			os.read(wake_read, 512)
+		if install_progress.winch_pending:
+			install_progress.apply_winsize()
 
 	def _read(self, install_progress: InstallProgress) -> bool:
 		"""Read data from the pty and send it for formatting."""
 		try:
-			# We need to read 4096 as sometimes dpkg gives us a lot of lines at one time.
-			data = os.read(self.child_fd, 4096)
+			data = os.read(self.child_fd, PTY_READ_SIZE)
 		except OSError as err:
 			if err.args[0] == errno.EIO:
 				# Linux-style EOF
@@ -1010,11 +1300,12 @@ class AptExpect(fdspawn):  # type: ignore[misc]
 
 	def _write(self, install_progress: InstallProgress) -> None:
 		"""Write user inputs into the pty."""
-		data = os.read(term.STDIN, 1000)
+		data = os.read(term.STDIN, PTY_READ_SIZE)
 		# Term up and clear in case we answer a question. This stops some live window artifacts.
 		# We need to not do this if we're in raw mode or else it breaks things.
 		if not install_progress.raw:
 			term.write((term.CURSER_UP + term.CLEAR_LINE) * 2)
-		while data != b"" and self.isalive():
-			split = os.write(self.child_fd, data)
-			data = data[split:]
+		# Slicing the view doesn't copy what's left on a partial write
+		view = memoryview(data)
+		while view and self.isalive():
+			view = view[os.write(self.child_fd, view) :]
@@ -224,7 +224,9 @@ def from_ansi(msg: str) -> Text:
 
 def ascii_replace(string: str) -> str:
 	"""If terminal is in ascii mode replace unicode characters."""
-	return string if is_utf8 else string.encode("ascii", "replace").decode("ascii")
+	if is_utf8 or string.isascii():
+		return string
+	return string.encode("ascii", "replace").decode("ascii")
 
 
 spinner = Spinner(SPIN_TYPE, style="bold blue")
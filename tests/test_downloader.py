@@ -0,0 +1,55 @@
+"""Tests for the mirror list handling in nala.downloader."""
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+pytest.importorskip("apt_pkg")
+
+# pylint: disable=wrong-import-position
+from nala.downloader import MirrorLists  # noqa: E402
+
+
+def test_mirror_lists_load_each_list_once() -> None:
+	"""Sets resolving at the same time share one load per list."""
+	mirrors = MirrorLists()
+	calls: list[str] = []
+	start = threading.Barrier(8)
+
+	def load(key: str) -> list[str]:
+		calls.append(key)
+		return [f"http://{key}/debian"]
+
+	def resolve(key: str) -> None:
+		start.wait()
+		assert mirrors.get(key, load) == [f"http://{key}/debian"]
+
+	threads = [
+		threading.Thread(target=resolve, args=(key,))
+		for key in ("one", "two") * 4
+	]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	assert sorted(calls) == ["one", "two"]
+
+
+def test_mirror_lists_cache_errors() -> None:
+	"""A list that failed to load fails again without loading again."""
+	mirrors = MirrorLists()
+	calls: list[str] = []
+	error = FileNotFoundError(2, "No such file or directory")
+
+	def load(key: str) -> list[str]:
+		calls.append(key)
+		raise error
+
+	for _ in range(3):
+		with pytest.raises(FileNotFoundError) as raised:
+			mirrors.get("/etc/apt/mirrors.txt", load)
+		assert raised.value is error
+
+	assert calls == ["/etc/apt/mirrors.txt"]
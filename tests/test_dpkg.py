@@ -0,0 +1,106 @@
+"""Tests for the dpkg output parsing in nala.dpkg."""
+from __future__ import annotations
+
+import pytest
+
+pytest.importorskip("apt_pkg")
+
+# pylint: disable=wrong-import-position
+from nala import color  # noqa: E402
+from nala.constants import DPKG_STATUS  # noqa: E402
+from nala.dpkg import (  # noqa: E402
+	DPKG_MSG_PREFIXES,
+	DPKG_MSG_TABLE,
+	DPKG_STATUS_PATTERN,
+	PAREN_CLOSE,
+	PAREN_OPEN,
+	InstallProgress,
+	color_version_token,
+	format_version,
+	msg_formatter,
+)
+
+
+@pytest.mark.parametrize("status", DPKG_STATUS)
+def test_status_pattern_matches_each_status(status: bytes) -> None:
+	"""Every DPKG_STATUS entry is found, even inside other output."""
+	assert DPKG_STATUS_PATTERN.search(b"\r" + status + b" 50%\r")
+
+
+def test_status_pattern_is_literal() -> None:
+	"""The brackets and dots in the statuses aren't regex syntax."""
+	assert not DPKG_STATUS_PATTERN.search(b"W Connected to")
+	assert not DPKG_STATUS_PATTERN.search(b"Reading changelogsXXX")
+	assert not DPKG_STATUS_PATTERN.search(b"Unpacking neofetch (7.1.0-3) ...")
+
+
+@pytest.mark.parametrize("prefix", DPKG_MSG_PREFIXES)
+def test_msg_formatter_uses_table(prefix: str) -> None:
+	"""Each dpkg prefix gets its own message and header."""
+	msg, key, header = DPKG_MSG_TABLE[prefix]
+	line = msg_formatter(f"{prefix} neofetch ...")
+	assert line == msg.format(**{key: header, "dpkg_msg": "neofetch"})
+
+
+def test_msg_formatter_prefix_initials_are_unique() -> None:
+	"""The prefix lookup by first letter relies on these being unique."""
+	assert len({prefix[0] for prefix in DPKG_MSG_PREFIXES}) == len(DPKG_MSG_PREFIXES)
+
+
+def test_msg_formatter_leaves_other_lines() -> None:
+	"""Lines without a known prefix or version pass through."""
+	assert msg_formatter("Selecting previously unselected package") == (
+		"Selecting previously unselected package"
+	)
+
+
+def test_color_version_token() -> None:
+	"""The parentheses and the version are colored separately."""
+	assert color_version_token("(7.1.0-3)") == (
+		f"{PAREN_OPEN}{color('7.1.0-3', 'BLUE')}{PAREN_CLOSE}"
+	)
+
+
+def test_format_version_only_colors_versions() -> None:
+	"""Parentheses that don't start with a digit are left alone."""
+	line = "Unpacking neofetch (7.1.0-3) over (7.1.0-2) (from the archive)"
+	assert format_version(line) == (
+		f"Unpacking neofetch {color_version_token('(7.1.0-3)')} over "
+		f"{color_version_token('(7.1.0-2)')} (from the archive)"
+	)
+
+
+class FakeStream:  # pylint: disable=too-few-public-methods
+	"""Status stream that gives back one chunk per read."""
+
+	def __init__(self, chunks: list[str]) -> None:
+		"""Status stream that gives back one chunk per read."""
+		self.chunks = chunks
+
+	def read(self, _size: int) -> str:
+		"""Return the next chunk."""
+		return self.chunks.pop(0) if self.chunks else ""
+
+
+def test_read_status_keeps_partial_line() -> None:
+	"""A line cut off at the end of a read is finished by the next one."""
+	progress = InstallProgress.__new__(InstallProgress)
+	progress.status_stream = FakeStream(  # type: ignore[assignment]
+		["pmstatus:neofetch:10:Unpack", "ing neofetch\npmstatus:nala:", "20:x\n"]
+	)
+	progress.status_buffer = ""
+	progress.advance_pending = 0
+	lines: list[str] = []
+	progress.update_progress_bar = lines.append  # type: ignore[assignment]
+
+	progress.read_status()
+	assert not lines
+	assert progress.status_buffer == "pmstatus:neofetch:10:Unpack"
+
+	progress.read_status()
+	assert lines == ["pmstatus:neofetch:10:Unpacking neofetch"]
+	assert progress.status_buffer == "pmstatus:nala:"
+
+	progress.read_status()
+	assert lines[-1] == "pmstatus:nala:20:x"
+	assert not progress.status_buffer